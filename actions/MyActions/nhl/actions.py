@@ -13,39 +13,117 @@ NOTES:
 
 from sema4ai.actions import action, Response, ActionError
 
-import json
-import requests
-from pathlib import Path
-from support import write_data_to_json
-
-BASE_URL = "https://api-web.nhle.com/v1"
+import functools
+import re
+import msgspec
+from typing import NamedTuple
+from support import (
+    fetch_many,
+    get_content,
+    get_json,
+    get_text,
+    is_empty_json,
+    read_data_from_json,
+    read_teams_db,
+    write_data_to_json,
+    write_teams_db,
+)
 
 
 @action
 def get_teams() -> Response[str]:
-    """Get teams from current standings as saves them as JSON file.
+    """Get teams from current standings and saves them as JSON and SQLite files.
 
     Returns:
         list of teams with their name and abbreviation
     """
-    url = f"{BASE_URL}/standings/now"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    standings = data.get("standings", [])
-    teams = []
-    # Perform case-insensitive search for full or partial match by abbreviation or name
-    for standing in standings:
-        teams.append(
-            {
-                "team_name": standing.get("teamName")["default"],
-                "team_abbreviation": standing.get("teamAbbrev")["default"],
-            }
-        )
+    global _teams
+    # Seed the in-memory list directly; the data/ files are written in the
+    # background and may not reflect this list yet
+    _teams = _fetch_and_write_teams()
+    _team_index.cache_clear()
+    get_team_abbreviation.cache_clear()
+    return _teams
+
+
+class LocalizedName(msgspec.Struct):
+    default: str
+
+
+class Standing(msgspec.Struct):
+    teamName: LocalizedName
+    teamAbbrev: LocalizedName
+
+
+class Standings(msgspec.Struct):
+    standings: list[Standing] = []
+
+
+# Decodes only the fields get_teams needs, skipping the rest of each standing
+_standings_decoder = msgspec.json.Decoder(Standings)
+
+
+def _fetch_and_write_teams() -> list:
+    """Fetch teams from current standings and save them under data/."""
+    standings = _standings_decoder.decode(get_content("/standings/now")).standings
+    teams = [
+        {
+            "team_name": standing.teamName.default,
+            "team_abbreviation": standing.teamAbbrev.default,
+        }
+        for standing in standings
+    ]
     write_data_to_json(teams, "teams")
+    write_teams_db(teams)
     return teams
 
 
+# Team list for this process, loaded on first use or replaced by get_teams
+_teams = None
+
+
+def _load_teams() -> list:
+    """Load the team list once per process, fetching it if it's not on disk."""
+    global _teams
+    if _teams is None:
+        teams = read_teams_db()
+        if teams is None:
+            teams = read_data_from_json("teams")
+        if teams is None:
+            teams = _fetch_and_write_teams()
+        _teams = teams
+    return _teams
+
+
+class TeamIndex(NamedTuple):
+    # casefolded team name or abbreviation -> abbreviation; this is also the
+    # O(1) path for queries that already are an abbreviation
+    exact: dict
+    # (casefolded name or abbreviation, abbreviation) in team order
+    substrings: list
+    # matches any casefolded team name contained in a query
+    names: re.Pattern
+
+
+@functools.lru_cache(maxsize=1)
+def _team_index() -> TeamIndex:
+    """Build case-insensitive lookup tables for get_team_abbreviation."""
+    exact = {}
+    substrings = []
+    names = []
+    for team in _load_teams():
+        abbreviation = team["team_abbreviation"]
+        name = team["team_name"].casefold()
+        names.append(name)
+        for key in (name, abbreviation.casefold()):
+            exact.setdefault(key, abbreviation)
+            substrings.append((key, abbreviation))
+    # Longest names first so the alternation prefers the most specific match
+    pattern = "|".join(map(re.escape, sorted(names, key=len, reverse=True)))
+    return TeamIndex(exact, substrings, re.compile(pattern or r"(?!)"))
+
+
+@functools.lru_cache(maxsize=256)
 def get_team_abbreviation(query: str) -> str:
     """Get team abbreviation by query.
 
@@ -55,15 +133,17 @@ def get_team_abbreviation(query: str) -> str:
     Returns:
         team abbreviation
     """
-    Path("data/teams.json").exists() or get_teams()
-    with open("data/teams.json", "r", encoding="utf-8") as f:
-        teams = json.load(f)
-    for team in teams:
-        if (
-            query.lower() in team["team_name"].lower()
-            or query.lower() in team["team_abbreviation"].lower()
-        ):
-            return team["team_abbreviation"]
+    index = _team_index()
+    q = query.casefold()
+    abbreviation = index.exact.get(q)
+    if abbreviation:
+        return abbreviation
+    match = index.names.search(q)
+    if match:
+        return index.exact[match.group(0)]
+    for key, abbreviation in index.substrings:
+        if q in key:
+            return abbreviation
     raise ValueError("Team not found")
 
 
@@ -80,11 +160,9 @@ def get_team_roster(
         list of players in the team
     """
     abbreviation = get_team_abbreviation(team_name_or_abbreviation)
-    url = f"{BASE_URL}/roster/{abbreviation}/current"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    remove_headshot(data)
+    data = get_json(
+        f"/roster/{abbreviation}/current", strip=True, refresh=refresh
+    )
     if not data:
         raise ActionError(f"Team {abbreviation} not found")
     write_data_to_json(data, f"team_{abbreviation}_roster")
@@ -106,33 +184,7 @@ def get_player_by_id(player_id: int) -> Response[str]:
     Returns:
         player information
     """
-    url = f"{BASE_URL}/player/{player_id}"
-    response = requests.get(url)
-    response.raise_for_status()
-    player = response.json()
-    return player
-
-
-def remove_headshot(data):
-    if isinstance(data, dict):
-        if "headshot" in data:
-            del data["headshot"]
-        for key, value in data.items():
-            remove_headshot(value)
-    elif isinstance(data, list):
-        for item in data:
-            remove_headshot(item)
-
-
-def remove_teamlogo(data):
-    if isinstance(data, dict):
-        if "teamLogo" in data:
-            del data["teamLogo"]
-        for key, value in data.items():
-            remove_teamlogo(value)
-    elif isinstance(data, list):
-        for item in data:
-            remove_teamlogo(item)
+    return Response(result=get_text(f"/player/{player_id}"))
 
 
 @action
@@ -145,13 +197,10 @@ def get_team_scoreboard(team_name_or_abbreviation: str) -> Response[str]:
         scoreboard of the team
     """
     abbreviation = get_team_abbreviation(team_name_or_abbreviation)
-    url = f"{BASE_URL}/scoreboard/{abbreviation}/now"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    if not data:
+    data = get_text(f"/scoreboard/{abbreviation}/now")
+    if is_empty_json(data):
         raise ActionError(f"Team {abbreviation} not found")
-    return data
+    return Response(result=data)
 
 
 @action
@@ -162,12 +211,9 @@ def get_standings_now() -> Response[str]:
     Returns:
         standings
     """
-    url = f"{BASE_URL}/standings/now"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
+    data = get_text("/standings/now")
     # TODO. lot of data returned and needs to be filtered and formatted as a table
-    return data
+    return Response(result=data)
 
 
 @action
@@ -177,13 +223,7 @@ def get_goalie_stat_leaders() -> Response[str]:
     Returns:
         goalier stats
     """
-    url = f"{BASE_URL}/goalie-stats-leaders/current"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    remove_headshot(data)
-    remove_teamlogo(data)
-    return data
+    return get_json("/goalie-stats-leaders/current", strip=True)
 
 
 @action
@@ -193,13 +233,7 @@ def get_skater_stat_leaders() -> Response[str]:
     Returns:
         skater stats
     """
-    url = f"{BASE_URL}/skater-stats-leaders/current"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    remove_headshot(data)
-    remove_teamlogo(data)
-    return data
+    return get_json("/skater-stats-leaders/current", strip=True)
 
 
 @action
@@ -212,12 +246,7 @@ def get_team_stats(team_name_or_abbreviation: str) -> Response[str]:
         stats of the team
     """
     abbreviation = get_team_abbreviation(team_name_or_abbreviation)
-    url = f"{BASE_URL}/club-stats/{abbreviation}/now"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    remove_headshot(data)
-    remove_teamlogo(data)
+    data = get_json(f"/club-stats/{abbreviation}/now", strip=True)
     if not data:
         raise ActionError(f"Team {abbreviation} not found")
     return data
@@ -233,13 +262,10 @@ def get_team_schedule(team_name_or_abbreviation: str) -> Response[str]:
         schedule of the team
     """
     abbreviation = get_team_abbreviation(team_name_or_abbreviation)
-    url = f"{BASE_URL}/club-schedule-season/{abbreviation}/now"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    if not data:
+    data = get_text(f"/club-schedule-season/{abbreviation}/now")
+    if is_empty_json(data):
         raise ActionError(f"Team {abbreviation} not found")
-    return data
+    return Response(result=data)
 
 
 @action
@@ -249,11 +275,7 @@ def get_daily_scores() -> Response[str]:
     Returns:
         daily scores
     """
-    url = f"{BASE_URL}/score/now"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    return data
+    return Response(result=get_text("/score/now"))
 
 
 @action
@@ -263,8 +285,33 @@ def get_scoreboard() -> Response[str]:
     Returns:
         scoreboard
     """
-    url = f"{BASE_URL}/scoreboard/now"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    return data
+    return Response(result=get_text("/scoreboard/now"))
+
+
+@action
+def get_team_dashboard(team_name_or_abbreviation: str) -> Response[str]:
+    """Get team roster, schedule, stats and scoreboard in one call
+
+    Args:
+        team_name_or_abbreviation: team abbreviation
+    Returns:
+        roster, schedule, stats and scoreboard of the team
+    """
+    abbreviation = get_team_abbreviation(team_name_or_abbreviation)
+    roster_path = f"/roster/{abbreviation}/current"
+    stats_path = f"/club-stats/{abbreviation}/now"
+    roster, schedule, stats, scoreboard = fetch_many(
+        [
+            roster_path,
+            f"/club-schedule-season/{abbreviation}/now",
+            stats_path,
+            f"/scoreboard/{abbreviation}/now",
+        ],
+        strip={roster_path, stats_path},
+    )
+    return {
+        "roster": roster,
+        "schedule": schedule,
+        "stats": stats,
+        "scoreboard": scoreboard,
+    }
@@ -1,6 +1,400 @@
-import json
+import asyncio
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
+import httpx
+import orjson
+import requests
+import zstandard
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def write_data_to_json(data, filename):
-    with open(f"data/{filename}.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps(data, indent=4, ensure_ascii=False))
+BASE_URL = "https://api-web.nhle.com/v1"
+REQUEST_TIMEOUT = (3, 10)
+DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip",
+    "User-Agent": "nhl-agent",
+}
+# Retry policy shared by the sync session and the async fan-out
+RETRIES = 3
+RETRY_BACKOFF = 0.2
+RETRY_STATUSES = (502, 503, 504)
+
+# Shared session so every action reuses keep-alive connections to the NHL API
+SESSION = requests.Session()
+SESSION.headers.update(DEFAULT_HEADERS)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=RETRIES,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            # Hand the last 5xx response back so raise_for_status raises HTTPError
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Seconds a response stays fresh, by the first path segment after /v1/
+TTL = {
+    "standings": 3600,
+    "roster": 86400,
+    "scoreboard": 15,
+    "score": 15,
+    "goalie-stats-leaders": 600,
+    "skater-stats-leaders": 600,
+    "club-stats": 600,
+    "club-schedule-season": 3600,
+    "player": 3600,
+}
+DEFAULT_TTL = 60
+CACHE_MAXSIZE = 256
+
+# url -> (expires_at, etag, last_modified, content), least recently used first.
+# Expired entries are kept (until evicted) so they can be revalidated.
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def ttl_for(url):
+    """Return how long a response from url may be served from the cache."""
+    endpoint = url.split("/v1/", 1)[-1].split("/", 1)[0]
+    return TTL.get(endpoint, DEFAULT_TTL)
+
+
+def _lookup(url, refresh=False):
+    """Return (entry, fresh content or None, conditional headers) for url.
+
+    With refresh, a cached entry is always revalidated, however fresh.
+    """
+    with _CACHE_LOCK:
+        entry = _CACHE.get(url)
+        if entry:
+            _CACHE.move_to_end(url)
+    headers = {}
+    if entry:
+        expires_at, etag, last_modified, content = entry
+        if not refresh and time.monotonic() < expires_at:
+            return entry, content, headers
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    return entry, None, headers
+
+
+def _store(url, ttl, entry, response):
+    """Cache a requests or httpx response for url and return its body."""
+    if entry and response.status_code == 304:
+        content = entry[3]
+    else:
+        response.raise_for_status()
+        content = response.content
+    if ttl is None:
+        ttl = ttl_for(url)
+    with _CACHE_LOCK:
+        _CACHE[url] = (
+            time.monotonic() + ttl,
+            response.headers.get("ETag", entry[1] if entry else None),
+            response.headers.get("Last-Modified", entry[2] if entry else None),
+            content,
+        )
+        _CACHE.move_to_end(url)
+        while len(_CACHE) > CACHE_MAXSIZE:
+            _CACHE.popitem(last=False)
+    return content
+
+
+def _fetch_content(url, ttl=None, refresh=False):
+    """GET the raw response body of url, caching it for ttl seconds.
+
+    Without ttl, the freshness lifetime comes from ttl_for(url).
+
+    Stale entries are revalidated with a conditional request, so an unchanged
+    resource only costs a 304 round trip instead of a full download. refresh
+    forces that revalidation even for a fresh entry.
+    """
+    entry, content, headers = _lookup(url, refresh)
+    if content is not None:
+        return content
+    response = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    return _store(url, ttl, entry, response)
+
+
+# One event loop thread and HTTP/2 client for the whole process, so fan-outs
+# reuse the same multiplexed connection instead of reconnecting every call
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+_ASYNC_CLIENT = None
+
+
+def _event_loop():
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True).start()
+            atexit.register(_close_event_loop, loop)
+            _LOOP = loop
+    return _LOOP
+
+
+def _close_event_loop(loop):
+    if _ASYNC_CLIENT is not None:
+        asyncio.run_coroutine_threadsafe(_ASYNC_CLIENT.aclose(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def _async_client():
+    # Only called on the loop thread, so no locking is needed
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(10, connect=3),
+            # requests follows redirects by default; /now endpoints rely on it
+            follow_redirects=True,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=RETRIES,
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+            ),
+        )
+    return _ASYNC_CLIENT
+
+
+async def _aget(url, headers):
+    """GET url, retrying 5xx responses like the session's Retry policy."""
+    client = _async_client()
+    for attempt in range(RETRIES + 1):
+        response = await client.get(url, headers=headers)
+        if response.status_code not in RETRY_STATUSES or attempt == RETRIES:
+            return response
+        await asyncio.sleep(RETRY_BACKOFF * 2**attempt)
+
+
+async def _afetch_content(url, ttl=None):
+    entry, content, headers = _lookup(url)
+    if content is not None:
+        return content
+    response = await _aget(url, headers)
+    try:
+        return _store(url, ttl, entry, response)
+    except httpx.HTTPStatusError as exc:
+        # Raise the same error type as the requests-based path
+        raise requests.HTTPError(str(exc)) from exc
+
+
+async def _afetch_many(urls):
+    return await asyncio.gather(*(_afetch_content(url) for url in urls))
+
+
+def get_content(path, ttl=None, refresh=False):
+    """GET the raw body of an NHL API path, e.g. "/standings/now".
+
+    Every action fetches through here, so sessions, caching and revalidation
+    apply to all endpoints alike.
+    """
+    return _fetch_content(f"{BASE_URL}{path}", ttl, refresh)
+
+
+def get_text(path, ttl=None):
+    """GET an NHL API path and return the JSON body unparsed, as text."""
+    return get_content(path, ttl).decode("utf-8")
+
+
+def get_json(path, ttl=None, strip=False, refresh=False):
+    """GET an NHL API path and parse the JSON body.
+
+    With strip, headshot and teamLogo fields are removed before parsing. With
+    refresh, a cached response is revalidated with the API first.
+    """
+    content = get_content(path, ttl, refresh)
+    if strip:
+        return loads_stripped(content)
+    return orjson.loads(content)
+
+
+def fetch_many(paths, strip=()):
+    """GET several independent NHL API paths concurrently, preserving order.
+
+    Responses for the paths listed in strip have headshot and teamLogo fields
+    removed. Cached responses are served without touching the network.
+    """
+    urls = [f"{BASE_URL}{path}" for path in paths]
+    future = asyncio.run_coroutine_threadsafe(_afetch_many(urls), _event_loop())
+    contents = future.result()
+    return [
+        loads_stripped(content) if path in strip else orjson.loads(content)
+        for path, content in zip(paths, contents)
+    ]
+
+
+def is_empty_json(text):
+    """Check whether an unparsed JSON body is an empty object or array."""
+    return text.strip() in ("", "{}", "[]")
+
+
+def strip_keys(data, drop=frozenset({"headshot", "teamLogo"})):
+    """Remove drop keys from every dict nested in data, in a single pass."""
+    stack = deque([data])
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            # One probe per key, and no temporary set like drop & node.keys()
+            for key in drop:
+                node.pop(key, None)
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+
+# A "headshot"/"teamLogo" string member together with one adjoining comma
+_STRIP = re.compile(
+    rb',\s*"(?:headshot|teamLogo)"\s*:\s*"(?:[^"\\]|\\.)*"'
+    rb'|"(?:headshot|teamLogo)"\s*:\s*"(?:[^"\\]|\\.)*"\s*,?'
+)
+
+
+def loads_stripped(content):
+    """Parse JSON bytes with headshot and teamLogo fields removed.
+
+    The string-valued fields are cut from the raw bytes, which is much cheaper
+    than walking the parsed tree. If that leaves invalid JSON the payload is
+    parsed as is instead, and whenever either key survives (e.g. with an
+    object or null value) the parsed data is cleaned with strip_keys.
+    """
+    cleaned = _STRIP.sub(b"", content)
+    try:
+        data = orjson.loads(cleaned)
+    except orjson.JSONDecodeError:
+        cleaned = content
+        data = orjson.loads(content)
+    if b'"headshot"' in cleaned or b'"teamLogo"' in cleaned:
+        strip_keys(data)
+    return data
+
+
+log = logging.getLogger(__name__)
+
+# Single writer thread keeps data/ writes off the action's critical path
+_WRITER = ThreadPoolExecutor(max_workers=1)
+atexit.register(_WRITER.shutdown, wait=True)
+# Only used from the writer thread, compressor objects are not thread-safe
+_COMPRESSOR = zstandard.ZstdCompressor(level=3)
+
+
+def _submit_write(fn, *args):
+    """Queue a data/ write, logging it if it fails since nobody waits on it."""
+    future = _WRITER.submit(fn, *args)
+    future.add_done_callback(_log_write_error)
+    return future
+
+
+def _log_write_error(future):
+    exc = future.exception()
+    if exc is not None:
+        log.error("Writing to data/ failed", exc_info=exc)
+
+
+def _do_write(content, path, compress):
+    if compress:
+        content = _COMPRESSOR.compress(content)
+    # Write to a temp file and swap it in so readers never see a partial file
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(content)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_data_to_json(data, filename, pretty=False):
+    """Write data to data/<filename>.json.zst in the background.
+
+    The data is serialized immediately, so later changes to it by the caller
+    do not leak into the file. With pretty, the data is written as indented,
+    uncompressed data/<filename>.json instead.
+    """
+    option = orjson.OPT_NON_STR_KEYS
+    path = f"data/{filename}.json.zst"
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+        path = f"data/{filename}.json"
+    content = orjson.dumps(data, option=option)
+    return _submit_write(_do_write, content, path, not pretty)
+
+
+def read_data_from_json(filename):
+    """Read data/<filename>.json.zst, falling back to data/<filename>.json.
+
+    Returns None when neither file exists.
+    """
+    path = Path(f"data/{filename}.json.zst")
+    if path.exists():
+        return orjson.loads(zstandard.ZstdDecompressor().decompress(path.read_bytes()))
+    path = Path(f"data/{filename}.json")
+    if path.exists():
+        return orjson.loads(path.read_bytes())
+    return None
+
+
+TEAMS_DB = "data/teams.sqlite"
+
+
+def _do_write_teams_db(rows):
+    # Build a fresh database and swap it in, like _do_write does for JSON: readers
+    # see the old or the new file, never an empty table, and a corrupt file is
+    # replaced rather than written into
+    tmp = f"{TEAMS_DB}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE teams (abbrev TEXT PRIMARY KEY, name TEXT NOT NULL)"
+            )
+            conn.executemany("INSERT INTO teams VALUES (?, ?)", rows)
+    finally:
+        conn.close()
+    os.replace(tmp, TEAMS_DB)
+
+
+def write_teams_db(teams):
+    """Store the team list in data/teams.sqlite in the background."""
+    rows = [(team["team_abbreviation"], team["team_name"]) for team in teams]
+    return _submit_write(_do_write_teams_db, rows)
+
+
+def read_teams_db():
+    """Read the team list from data/teams.sqlite, or None if it isn't usable.
+
+    The database is opened read-only, so any number of action workers can read
+    it while get_teams replaces its contents.
+    """
+    if not Path(TEAMS_DB).exists():
+        return None
+    conn = sqlite3.connect(f"file:{TEAMS_DB}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT abbrev, name FROM teams ORDER BY rowid").fetchall()
+    except sqlite3.DatabaseError:
+        # Missing table or a corrupt file; let the caller fall back to JSON
+        return None
+    finally:
+        conn.close()
+    if not rows:
+        return None
+    return [
+        {"team_name": name, "team_abbreviation": abbreviation}
+        for abbreviation, name in rows
+    ]